@@ -0,0 +1,120 @@
+"""
+Background AI refactoring jobs.
+
+A job's id is the SHA-256 of the analyzer name and the submitted code.
+Submitting identical code again returns the existing job: the cached result
+if it finished, or the in-flight job if it is still running. Failed jobs
+are retried on the next submit. Analysis runs on a bounded thread pool, and
+submissions beyond ``max_pending`` unfinished jobs are rejected.
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from ai_refactor import get_analyzer
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+class QueueFullError(Exception):
+    """Too many unfinished jobs; the caller should retry later."""
+
+
+class RefactorJob:
+    def __init__(self, job_id: str):
+        self.id = job_id
+        self.status = PENDING
+        self.result: Optional[str] = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.finished: Future = Future()  # resolved when the job ends either way
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait on the event loop, not a worker thread; True once finished."""
+        done, _ = await asyncio.wait({asyncio.wrap_future(self.finished)}, timeout=timeout)
+        return bool(done)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class RefactorJobQueue:
+    def __init__(self, analyzer=None, max_workers: int = 2, max_pending: int = 32, cache_size: int = 256):
+        self.analyzer = analyzer or get_analyzer()
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self._jobs: "OrderedDict[str, RefactorJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-refactor")
+
+    def job_id(self, code: str) -> str:
+        return hashlib.sha256(f"{self.analyzer.name}\0{code}".encode()).hexdigest()
+
+    def submit(self, code: str) -> RefactorJob:
+        job_id = self.job_id(code)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status != FAILED:
+                self._jobs.move_to_end(job_id)
+                return job
+            unfinished = sum(1 for j in self._jobs.values() if not j.finished.done())
+            if unfinished >= self.max_pending:
+                raise QueueFullError(f"{unfinished} refactoring jobs already queued")
+            job = RefactorJob(job_id)
+            self._jobs[job_id] = job
+            self._evict()
+        self._executor.submit(self._run, job, code)
+        return job
+
+    def _evict(self):
+        # Drop the oldest finished jobs; unfinished ones are never evicted.
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.cache_size:
+                break
+            if self._jobs[job_id].finished.done():
+                del self._jobs[job_id]
+
+    def _run(self, job: RefactorJob, code: str):
+        job.status = RUNNING
+        try:
+            job.result = self.analyzer.analyze(code)
+            job.status = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            job.finished.set_result(None)
+
+    def get(self, job_id: str) -> Optional[RefactorJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_queue: Optional[RefactorJobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> RefactorJobQueue:
+    """Process-wide queue, created on first use with the configured analyzer."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = RefactorJobQueue()
+        return _queue
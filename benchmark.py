@@ -0,0 +1,524 @@
+"""
+In-process benchmark harness for generated FastAPI code.
+
+The code returned by ``/generate_sample_code`` is compiled, executed against a
+throwaway in-memory SQLite database and driven with a short, fixed CRUD
+workload through ``fastapi.testclient.TestClient``. Nothing touches the real
+``org_users.db`` file.
+
+``storage`` compares the storage backends from storage.py: memory per million
+users and ops/sec for create/get/update/delete through the backend API.
+``restart`` measures how long a durable memory store with 1M users takes to
+come back from its latest snapshot plus log tail, against rebuilding it from
+SQLite.
+``encoding`` compares bytes on the wire and server CPU per response for
+JSON and MessagePack, each uncompressed, gzip and zstd.
+
+CLI:
+    python benchmark.py code generated.json --org-id <org_id>
+    curl ".../generate_sample_code?org_id=..&org_name=.." | python benchmark.py code - --org-id <org_id>
+    python benchmark.py storage --users 200000 --ops 5000
+    python benchmark.py restart --users 1000000 --tail 10000
+    python benchmark.py encoding --users 1000
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+DEFAULT_ITERATIONS = 50
+
+# Swapping sys.modules["database"] is process-global, so only one generated
+# module may be executed at a time.
+_exec_lock = threading.Lock()
+
+
+class BenchmarkError(Exception):
+    """Raised when generated code cannot be compiled or mounted."""
+
+
+def compile_generated_code(code: str):
+    try:
+        return compile(code, "<generated_api>", "exec")
+    except SyntaxError as e:
+        raise BenchmarkError(f"Generated code does not compile: line {e.lineno}: {e.msg}")
+
+
+def _throwaway_database():
+    """Build a stand-in for the ``database`` module backed by in-memory SQLite."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    import database
+
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,  # one shared connection, so every session sees the same DB
+    )
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    module = types.ModuleType("database")
+    module.DATABASE_URL = "sqlite://"
+    module.Base = database.Base
+    module.engine = engine
+    module.SessionLocal = SessionLocal
+    module.get_db = get_db
+    return module
+
+
+@contextmanager
+def mount_generated_app(code: str, org_id: str):
+    """Compile and execute generated code, yielding its FastAPI ``app``."""
+    from fastapi import FastAPI
+    from auth import verify_token
+
+    compiled = compile_generated_code(code)
+    throwaway = _throwaway_database()
+    namespace = {"__name__": "generated_api"}
+
+    with _exec_lock:
+        saved = sys.modules.get("database")
+        sys.modules["database"] = throwaway
+        try:
+            exec(compiled, namespace)
+        except Exception as e:
+            raise BenchmarkError(f"Generated code failed to import: {e!r}")
+        finally:
+            if saved is not None:
+                sys.modules["database"] = saved
+            else:
+                sys.modules.pop("database", None)
+
+    app = namespace.get("app")
+    if not isinstance(app, FastAPI):
+        throwaway.engine.dispose()
+        raise BenchmarkError("Generated code does not define a FastAPI `app`")
+
+    # Every request runs as an admin of the org, so auth is not measured.
+    app.dependency_overrides[verify_token] = lambda: {"org_id": org_id, "role": "admin"}
+    try:
+        yield app
+    finally:
+        throwaway.engine.dispose()
+
+
+def _user_payload(org_id: str, i: int, name: str = "Bench User") -> dict:
+    created = datetime(2025, 1, 1) + timedelta(minutes=i)
+    return {
+        "org_user_id": f"bench-{i:06d}",
+        "org_id": org_id,
+        "name": f"{name} {i}",
+        "contact_no": f"{9000000000 + i}",
+        "employee_code": f"EMP{i:06d}",
+        "created_date": created.isoformat(),
+        "valid_till": (created + timedelta(days=365)).isoformat(),
+    }
+
+
+def _crud_routes(app):
+    """Find the collection route (no path params) and item route (one param)."""
+    from fastapi.routing import APIRoute
+
+    collection, item = {}, {}
+    for route in app.routes:
+        if not isinstance(route, APIRoute):
+            continue  # skip /docs, /openapi.json and mounts
+        params = re.findall(r"{(\w+)}", route.path)
+        for method in route.methods:
+            if not params:
+                collection.setdefault(method, route.path)
+            elif len(params) == 1:
+                item.setdefault(method, route.path)
+    return collection, item
+
+
+def _summarize(latencies, errors):
+    if not latencies:
+        return {"count": 0, "errors": errors}
+    ordered = sorted(latencies)
+    total = sum(ordered)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": round(pct(0.50) * 1000, 3),
+        "p95_ms": round(pct(0.95) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "ops_per_sec": round(len(ordered) / total, 1) if total else None,
+    }
+
+
+def run_workload(app, org_id: str, iterations: int = DEFAULT_ITERATIONS) -> dict:
+    """Drive create -> get -> update -> delete for ``iterations`` users."""
+    from fastapi.testclient import TestClient
+
+    collection, item = _crud_routes(app)
+    plan = [
+        ("create", "POST", collection.get("POST"), False),
+        ("get", "GET", item.get("GET"), True),
+        ("update", "PUT", item.get("PUT"), True),
+        ("delete", "DELETE", item.get("DELETE"), True),
+    ]
+    operations = {}
+    started = time.perf_counter()
+    with TestClient(app) as client:
+        client.headers["Authorization"] = "Bearer benchmark"
+        for op, method, path, per_item in plan:
+            if path is None:
+                continue
+            latencies, errors = [], 0
+            for i in range(iterations):
+                payload = _user_payload(org_id, i)
+                url = path
+                if per_item:
+                    url = re.sub(r"{\w+}", payload["org_user_id"], path)
+                body = None
+                if method == "POST":
+                    body = payload
+                elif method == "PUT":
+                    body = _user_payload(org_id, i, name="Updated User")
+                t0 = time.perf_counter()
+                res = client.request(method, url, json=body)
+                latencies.append(time.perf_counter() - t0)
+                if res.status_code >= 400:
+                    errors += 1
+            operations[op] = _summarize(latencies, errors)
+    elapsed = time.perf_counter() - started
+
+    total_requests = sum(o["count"] for o in operations.values())
+    return {
+        "routes": sorted(
+            f"{m} {p}" for table in (collection, item) for m, p in table.items()
+        ),
+        "iterations": iterations,
+        "requests": total_requests,
+        "errors": sum(o["errors"] for o in operations.values()),
+        "duration_s": round(elapsed, 4),
+        "throughput_rps": round(total_requests / elapsed, 1) if elapsed else None,
+        "operations": operations,
+    }
+
+
+def benchmark_generated_code(
+    code: str, org_id: str, iterations: int = DEFAULT_ITERATIONS
+) -> dict:
+    """Compile, mount and benchmark generated code; returns a JSON-able report."""
+    with mount_generated_app(code, org_id) as app:
+        report = run_workload(app, org_id, iterations)
+    report["compiled"] = True
+    return report
+
+
+def _time_ops(storage, org_id: str, ops: int) -> dict:
+    """ops/sec for each CRUD call against a backend, on ``ops`` fresh users."""
+    from models import User
+
+    users = [User(**_user_payload(org_id, 10_000_000 + i)) for i in range(ops)]
+    renamed = [User(**_user_payload(org_id, 10_000_000 + i, name="Renamed")) for i in range(ops)]
+    steps = [
+        ("create", lambda i: storage.create(users[i])),
+        ("get", lambda i: storage.get(org_id, users[i].org_user_id)),
+        ("update", lambda i: storage.update(org_id, users[i].org_user_id, renamed[i])),
+        ("delete", lambda i: storage.delete(org_id, users[i].org_user_id)),
+    ]
+    # Untimed round first: memory freed by earlier measurements is faulted
+    # back in here rather than billed to "create"
+    for i in range(ops):
+        storage.create(users[i])
+        storage.delete(org_id, users[i].org_user_id)
+    result = {}
+    for op, call in steps:
+        t0 = time.perf_counter()
+        for i in range(ops):
+            call(i)
+        result[op] = round(ops / (time.perf_counter() - t0), 1)
+    return result
+
+
+def _populate_rows(n: int):
+    from models import User
+
+    return [User(**_user_payload(f"org-{i % 100}", i)) for i in range(n)]
+
+
+def _change_feed_bytes(retention: int) -> int:
+    """
+    Memory the memory backend's change feed holds when full. Worst case: one
+    user updated ``retention`` times, so every change pins a replaced record.
+    """
+    from models import User
+    from storage import InMemoryStorage
+
+    def updated(change_retention):
+        tracemalloc.start()
+        storage = InMemoryStorage(change_retention=change_retention)
+        payload = _user_payload("org-feed", 0)
+        storage.create(User(**payload))
+        for i in range(retention):
+            storage.update("org-feed", payload["org_user_id"], User(**{**payload, "name": f"Rev {i}"}))
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size
+
+    return updated(retention) - updated(0)
+
+
+def benchmark_storage(users: int = 100_000, ops: int = 5_000) -> dict:
+    """
+    Memory per million users (measured on ``users`` and scaled) and ops/sec
+    for the in-memory and SQLAlchemy backends. SQLite runs on a temp file.
+    The memory backend's change feed is capped, so it is reported separately
+    as a fixed cost.
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    from models import User, UserDB
+    from storage import MEMORY_CHANGE_RETENTION, InMemoryStorage, SQLAlchemyStorage
+
+    population = _populate_rows(users)
+    scale = 1_000_000 / users
+    report = {"users_measured": users, "ops": ops}
+
+    # The nested dict of full Pydantic objects storage.py used to hold
+    tracemalloc.start()
+    nested = {}
+    for user in population:
+        nested.setdefault(user.org_id, {})[user.org_user_id] = User(**user.dict())
+    pydantic_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del nested
+
+    tracemalloc.start()
+    memory = InMemoryStorage(change_retention=0)
+    for user in population:
+        memory.create(user)
+    memory_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del memory
+
+    memory = InMemoryStorage()  # ops include the change feed at default retention
+    for user in population:
+        memory.create(user)
+    report["memory"] = {
+        "mb_per_million_users": round(memory_bytes * scale / 2**20, 1),
+        "change_feed_mb": round(_change_feed_bytes(MEMORY_CHANGE_RETENTION) / 2**20, 1),
+        "change_retention": MEMORY_CHANGE_RETENTION,
+        "ops_per_sec": _time_ops(memory, "org-bench", ops),
+    }
+    report["pydantic_dict"] = {
+        "mb_per_million_users": round(pydantic_bytes * scale / 2**20, 1),
+    }
+    del memory
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(UserDB.__table__.insert(), [u.dict() for u in population])
+        disk_bytes = os.path.getsize(path)
+        db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+        try:
+            report["sqlalchemy"] = {
+                "disk_mb_per_million_users": round(disk_bytes * scale / 2**20, 1),
+                "ops_per_sec": _time_ops(SQLAlchemyStorage(db), "org-bench", ops),
+            }
+        finally:
+            db.close()
+            engine.dispose()
+    return report
+
+
+def benchmark_restart(users: int = 1_000_000, tail: int = 10_000, fsync_batch: int = 64) -> dict:
+    """
+    Fill a journaled memory store, snapshot it, log ``tail`` more updates and
+    time a cold restart. Rebuilding the same users from SQLite is timed too.
+    """
+    from sqlalchemy import create_engine, select
+    from database import Base
+    from models import User, UserDB
+    from persistence import Journal
+    from storage import InMemoryStorage
+
+    report = {"users": users, "tail": tail, "fsync_batch": fsync_batch}
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, "memstore")
+        journal = Journal(data_dir, fsync_batch=0)  # bulk load; batching applies to the tail
+        store = InMemoryStorage(journal)
+        for i in range(users):
+            store.create(User(**_user_payload(f"org-{i % 100}", i)))
+        t0 = time.perf_counter()
+        store.snapshot()
+        report["snapshot_write_s"] = round(time.perf_counter() - t0, 3)
+        snapshot = [f for f in os.listdir(data_dir) if f.endswith(".bin")][0]
+        report["snapshot_mb"] = round(os.path.getsize(os.path.join(data_dir, snapshot)) / 2**20, 1)
+
+        journal.fsync_batch = fsync_batch
+        updates = [User(**_user_payload(f"org-{i % 100}", i, name="Tail")) for i in range(tail)]
+        t0 = time.perf_counter()
+        for user in updates:
+            store.update(user.org_id, user.org_user_id, user)
+        elapsed = time.perf_counter() - t0
+        report["tail_updates_per_sec"] = round(tail / elapsed, 1) if elapsed else None
+        store.close()
+        del store
+
+        t0 = time.perf_counter()
+        restarted = InMemoryStorage(Journal(data_dir))
+        report["restart_s"] = round(time.perf_counter() - t0, 3)
+        report["recovery"] = restarted.recovery
+        assert len(restarted) == users
+        restarted.close()
+        del restarted
+
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'rebuild.db')}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            batch = []
+            for i in range(users):
+                batch.append(_user_payload(f"org-{i % 100}", i))
+                if len(batch) == 50_000 or i == users - 1:
+                    conn.execute(
+                        UserDB.__table__.insert(),
+                        [User(**row).dict() for row in batch],
+                    )
+                    batch = []
+        t0 = time.perf_counter()
+        rebuilt = InMemoryStorage()
+        with engine.connect() as conn:
+            for row in conn.execute(select(UserDB.__table__)):
+                rebuilt.create(User(**row._mapping))
+        report["sqlite_rebuild_s"] = round(time.perf_counter() - t0, 3)
+        engine.dispose()
+    return report
+
+
+def benchmark_encoding(users: int = 1000, repeat: int = 200) -> dict:
+    """
+    For representative responses, bytes on the wire and server CPU time per
+    response for every encoding the negotiation middleware can produce.
+    CPU covers transcoding and compression, not the endpoint itself.
+    """
+    import negotiation
+    from main import generate_sample_code
+    from models import User
+
+    from fastapi.encoders import jsonable_encoder
+
+    def render(content) -> bytes:
+        # What FastAPI sends: jsonable_encoder, then starlette's JSONResponse
+        return json.dumps(
+            jsonable_encoder(content),
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+    found = [User(**_user_payload("org-bench", i)).dict() for i in range(users)]
+    payloads = {
+        "generate_sample_code": render(generate_sample_code("org-bench", "Acme")),
+        "get_user": render(_user_payload("org-bench", 0)),
+        f"multi_get_{users}": render({"found": found, "missing": []}),
+    }
+    formats = ["json"] + (["msgpack"] if negotiation.msgpack else [])
+    codings = [None] + list(reversed(negotiation.available_encodings()))
+
+    report = {}
+    for name, body in payloads.items():
+        rows = {}
+        for fmt in formats:
+            for coding in codings:
+                def encode():
+                    data = negotiation.json_to_msgpack(body) if fmt == "msgpack" else body
+                    return negotiation.compress(data, coding) if coding else data
+
+                encoded = encode()
+                t0 = time.process_time()
+                for _ in range(repeat):
+                    encode()
+                cpu = (time.process_time() - t0) / repeat
+                rows[f"{fmt}+{coding}" if coding else fmt] = {
+                    "bytes": len(encoded),
+                    "cpu_us": round(cpu * 1e6, 1),
+                }
+        report[name] = rows
+    return report
+
+
+def _read_generated_code(path: str) -> str:
+    raw = sys.stdin.read() if path == "-" else open(path).read()
+    # Accept either the raw code or the JSON body of /generate_sample_code
+    try:
+        return json.loads(raw)["generated_code"]
+    except (ValueError, KeyError, TypeError):
+        return raw
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    code_cmd = commands.add_parser("code", help="benchmark generated CRUD code")
+    code_cmd.add_argument("source", help="file with generated code or its JSON, '-' for stdin")
+    code_cmd.add_argument("--org-id", required=True)
+    code_cmd.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+
+    storage_cmd = commands.add_parser("storage", help="compare storage backends")
+    storage_cmd.add_argument("--users", type=int, default=100_000)
+    storage_cmd.add_argument("--ops", type=int, default=5_000)
+
+    restart_cmd = commands.add_parser("restart", help="time memory store recovery")
+    restart_cmd.add_argument("--users", type=int, default=1_000_000)
+    restart_cmd.add_argument("--tail", type=int, default=10_000)
+    restart_cmd.add_argument("--fsync-batch", type=int, default=64)
+
+    encoding_cmd = commands.add_parser("encoding", help="compare response encodings")
+    encoding_cmd.add_argument("--users", type=int, default=1000)
+    encoding_cmd.add_argument("--repeat", type=int, default=200)
+
+    args = parser.parse_args(argv)
+    if args.command == "code":
+        try:
+            report = benchmark_generated_code(
+                _read_generated_code(args.source), args.org_id, args.iterations
+            )
+        except BenchmarkError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 1
+        print(json.dumps(report, indent=2))
+    elif args.command == "storage":
+        print(json.dumps(benchmark_storage(args.users, args.ops), indent=2))
+    elif args.command == "restart":
+        report = benchmark_restart(args.users, args.tail, args.fsync_batch)
+        print(json.dumps(report, indent=2))
+    elif args.command == "encoding":
+        print(json.dumps(benchmark_encoding(args.users, args.repeat), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+Per-org change feed fan-out for the SSE and WebSocket endpoints.
+
+Each org with at least one subscriber has a single poller that reads the
+outbox every CHANGE_POLL_SECONDS and hands new batches to every subscriber,
+so the store sees one query per org per interval however many consumers
+are connected. A subscriber that resumes from an older cursor first catches
+up with its own reads, then switches to the shared batches. A subscriber
+that falls more than SUBSCRIBER_BACKLOG batches behind is disconnected and
+resumes from its last event id on reconnect.
+
+Pollers live on the event loop of the serving process and stop when their
+last subscriber leaves.
+"""
+
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+
+from storage import open_storage
+
+CHANGE_POLL_SECONDS = float(os.getenv("CHANGE_POLL_SECONDS", "0.5"))
+CHANGE_BATCH = 500
+KEEP_ALIVE_SECONDS = 15
+SUBSCRIBER_BACKLOG = 100
+
+logger = logging.getLogger(__name__)
+
+
+def read_changes(org_id: str, cursor: Optional[int]):
+    """(changes after ``cursor``, new cursor); None starts at the latest change."""
+    with open_storage(readonly=True, org_id=org_id) as storage:
+        if cursor is None:
+            return [], storage.latest_change_id(org_id)
+        batch = storage.changes_since(org_id, cursor, CHANGE_BATCH)
+        return batch, batch[-1]["id"] if batch else cursor
+
+
+class OrgPoller:
+    def __init__(self, org_id: str, hub: "ChangeFeedHub"):
+        self.org_id = org_id
+        self.hub = hub
+        self.cursor: Optional[int] = None
+        self.ready = asyncio.Event()
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        try:
+            while self.subscribers:
+                try:
+                    batch, self.cursor = await run_in_threadpool(
+                        read_changes, self.org_id, self.cursor
+                    )
+                except Exception:
+                    logger.exception("Polling changes for org %s failed", self.org_id)
+                    batch = []
+                if self.cursor is not None:
+                    self.ready.set()
+                if batch:
+                    self._broadcast(batch)
+                    if len(batch) == CHANGE_BATCH:
+                        continue
+                await asyncio.sleep(CHANGE_POLL_SECONDS)
+        finally:
+            # No await since the last subscriber check, so none joined since
+            if self.hub.pollers.get(self.org_id) is self:
+                del self.hub.pollers[self.org_id]
+
+    def _broadcast(self, batch: List[dict]):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(batch)
+            except asyncio.QueueFull:
+                # Too far behind: end its stream so it resumes from its cursor
+                self.subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+
+class ChangeFeedHub:
+    def __init__(self):
+        self.pollers: Dict[str, OrgPoller] = {}
+
+    async def batches(self, org_id: str, cursor: Optional[int]) -> AsyncIterator[List[dict]]:
+        """
+        Yields lists of changes after ``cursor`` (None: start at the latest),
+        and an empty list every KEEP_ALIVE_SECONDS while the org is quiet.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_BACKLOG)
+        poller = self.pollers.get(org_id)
+        if (
+            poller is None
+            or poller.task.done()
+            or poller.task.get_loop() is not asyncio.get_running_loop()
+        ):
+            poller = self.pollers[org_id] = OrgPoller(org_id, self)
+        poller.subscribers.add(queue)
+        try:
+            while not poller.ready.is_set():
+                try:
+                    await asyncio.wait_for(poller.ready.wait(), KEEP_ALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield []
+            # Everything after `live` reaches the queue; read up to it directly
+            live = poller.cursor
+            if cursor is None:
+                cursor = live
+            while cursor < live:
+                batch, cursor = await run_in_threadpool(read_changes, org_id, cursor)
+                if not batch:
+                    break
+                yield batch
+            while True:
+                try:
+                    batch = await asyncio.wait_for(queue.get(), KEEP_ALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield []
+                    continue
+                if batch is None:
+                    return
+                batch = [change for change in batch if change["id"] > cursor]
+                if batch:
+                    cursor = batch[-1]["id"]
+                    yield batch
+        finally:
+            poller.subscribers.discard(queue)
+
+
+_hub: Optional[ChangeFeedHub] = None
+
+
+def get_hub() -> ChangeFeedHub:
+    """Process-wide hub, created on first use."""
+    global _hub
+    if _hub is None:
+        _hub = ChangeFeedHub()
+    return _hub
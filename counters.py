@@ -0,0 +1,185 @@
+"""
+Incrementally maintained per-org user statistics.
+
+Instead of COUNT(*) over ``users``, each org keeps counters bucketed by day:
+
+    ("total", 0)            users in the org
+    ("created", day)        users whose created_date falls on that day
+    ("valid_till", day)     users whose valid_till falls on that day
+
+Stats for a 7 or 30 day window add up at most 30 buckets. Windows are whole
+UTC days, so "expiring in the next 7 days" counts today plus the six days
+after it.
+
+The SQLAlchemy backend updates counters in the same transaction as the user
+row. ``reconcile`` recomputes them from ``users`` to repair drift. On
+startup main.py calls ``backfill``, which reconciles only while the table is
+still empty, e.g. for rows written before it existed. Repair drift with:
+
+    python counters.py reconcile [--org-id ORG_ID]
+"""
+
+import argparse
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import OrgUserCounterDB, UserDB
+
+TOTAL, CREATED, VALID_TILL = "total", "created", "valid_till"
+WINDOWS = (7, 30)
+
+# (org_id, metric, day) -> delta
+Deltas = Dict[Tuple[str, str, int], int]
+
+
+def _day(value: Optional[datetime]) -> Optional[int]:
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.toordinal()
+
+
+def user_deltas(user, sign: int, deltas: Optional[Deltas] = None) -> Deltas:
+    """Add (sign=1) or remove (sign=-1) one user's contribution to ``deltas``."""
+    # Runs for every user the memory backend loads, so it stays flat
+    deltas = {} if deltas is None else deltas
+    org_id = user.org_id
+    key = (org_id, TOTAL, 0)
+    deltas[key] = deltas.get(key, 0) + sign
+    created, valid_till = _day(user.created_date), _day(user.valid_till)
+    if created is not None:
+        key = (org_id, CREATED, created)
+        deltas[key] = deltas.get(key, 0) + sign
+    if valid_till is not None:
+        key = (org_id, VALID_TILL, valid_till)
+        deltas[key] = deltas.get(key, 0) + sign
+    return deltas
+
+
+def summarize(count: Callable[[str, int, int], int], now: Optional[datetime] = None) -> dict:
+    """Build the stats dict from ``count(metric, first_day, last_day)``."""
+    today = _day(now or datetime.utcnow())
+    stats = {"total_users": count(TOTAL, 0, 0)}
+    for days in WINDOWS:
+        stats[f"expiring_next_{days}_days"] = count(VALID_TILL, today, today + days - 1)
+        stats[f"created_last_{days}_days"] = count(CREATED, today - days + 1, today)
+    return stats
+
+
+def apply_deltas(db: Session, deltas: Deltas):
+    """Stage counter increments in ``db``; the caller commits with the user row."""
+    for (org_id, metric, day), delta in deltas.items():
+        if not delta:
+            continue
+        result = db.execute(
+            update(OrgUserCounterDB)
+            .where(
+                OrgUserCounterDB.org_id == org_id,
+                OrgUserCounterDB.metric == metric,
+                OrgUserCounterDB.day == day,
+            )
+            .values(count=OrgUserCounterDB.count + delta)
+        )
+        if result.rowcount == 0:
+            # Writes go through the single write connection, so no insert race
+            db.add(OrgUserCounterDB(org_id=org_id, metric=metric, day=day, count=delta))
+            db.flush()
+
+
+def org_stats(db: Session, org_id: str, now: Optional[datetime] = None) -> dict:
+    today = _day(now or datetime.utcnow())
+    horizon = max(WINDOWS)
+    rows = (
+        db.query(OrgUserCounterDB.metric, OrgUserCounterDB.day, OrgUserCounterDB.count)
+        .filter(
+            OrgUserCounterDB.org_id == org_id,
+            OrgUserCounterDB.day.between(today - horizon, today + horizon),
+        )
+        .all()
+    )
+    total = (
+        db.query(OrgUserCounterDB.count)
+        .filter_by(org_id=org_id, metric=TOTAL, day=0)
+        .scalar()
+    )
+    buckets = {(metric, day): n for metric, day, n in rows}
+    buckets[(TOTAL, 0)] = total or 0
+    return summarize(lambda m, lo, hi: _sum_buckets(buckets, m, lo, hi), now)
+
+
+def _sum_buckets(buckets: Dict[Tuple[str, int], int], metric: str, first: int, last: int) -> int:
+    return sum(n for (m, day), n in buckets.items() if m == metric and first <= day <= last)
+
+
+def reconcile(db: Session, org_id: Optional[str] = None) -> dict:
+    """Recompute counters from ``users`` and fix any that drifted. Commits."""
+    actual: Counter = Counter()
+    query = db.query(UserDB.org_id, UserDB.created_date, UserDB.valid_till)
+    if org_id is not None:
+        query = query.filter(UserDB.org_id == org_id)
+    for row in query.yield_per(10_000):
+        user_deltas(row, 1, actual)
+
+    stored_query = db.query(OrgUserCounterDB)
+    if org_id is not None:
+        stored_query = stored_query.filter(OrgUserCounterDB.org_id == org_id)
+    repaired = 0
+    seen = set()
+    for counter in stored_query.all():
+        key = (counter.org_id, counter.metric, counter.day)
+        seen.add(key)
+        expected = actual.get(key, 0)
+        if counter.count != expected:
+            repaired += 1
+            if expected:
+                counter.count = expected
+            else:
+                db.delete(counter)
+        elif not expected:
+            db.delete(counter)  # drop empty buckets
+    for key, expected in actual.items():
+        if key not in seen and expected:
+            repaired += 1
+            db.add(OrgUserCounterDB(org_id=key[0], metric=key[1], day=key[2], count=expected))
+    db.commit()
+    return {"orgs": len({key[0] for key in actual}), "repaired": repaired}
+
+
+def backfill(db: Session) -> Optional[dict]:
+    """Reconcile once per database: only if users exist but no counters do."""
+    if db.query(OrgUserCounterDB.org_id).first() is not None:
+        return None
+    if db.query(UserDB.org_user_id).first() is None:
+        return None
+    try:
+        return reconcile(db)
+    except IntegrityError:
+        db.rollback()  # another worker backfilled first
+        return None
+
+
+def main(argv: Optional[List[str]] = None):
+    from database import Base, SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Per-org user counters")
+    commands = parser.add_subparsers(dest="command", required=True)
+    reconcile_cmd = commands.add_parser("reconcile", help="repair counter drift")
+    reconcile_cmd.add_argument("--org-id")
+    args = parser.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        print(reconcile(db, args.org_id))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
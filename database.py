@@ -1,14 +1,98 @@
-from sqlalchemy import create_engine
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
 DATABASE_URL = "sqlite:///./org_users.db"  # Using SQLite for simplicity
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Reads go to a replica when READ_DATABASE_URL is set, otherwise to a pool of
+# connections to the primary (read-only URI connections for a SQLite file).
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "8"))
+# How long reads for an org stay on the primary after it mutates
+READ_AFTER_WRITE_SECONDS = float(os.getenv("READ_AFTER_WRITE_SECONDS", "2"))
+
+
+def _sqlite_read_only_url(url: str) -> Optional[str]:
+    prefix = "sqlite:///"
+    if not url.startswith(prefix) or url == prefix or ":memory:" in url:
+        return None
+    return f"sqlite:///file:{url[len(prefix):]}?mode=ro&uri=true"
+
+
+_sqlite = DATABASE_URL.startswith("sqlite")
+_connect_args = {"check_same_thread": False} if _sqlite else {}
+
+# Single write connection: writers queue for it, so writes stay serialized
+engine = create_engine(
+    DATABASE_URL,
+    connect_args=_connect_args,
+    poolclass=QueuePool,
+    pool_size=1,
+    max_overflow=0,
+)
+
+if _sqlite:
+
+    @event.listens_for(engine, "connect")
+    def _enable_wal(dbapi_connection, connection_record):
+        # WAL lets read-only connections read while the writer commits
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+
+def _read_pool(url: str):
+    return create_engine(
+        url,
+        connect_args={"check_same_thread": False} if url.startswith("sqlite") else {},
+        poolclass=QueuePool,
+        pool_size=READ_POOL_SIZE,
+        max_overflow=READ_POOL_SIZE,
+    )
+
+
+# Reads never take the single write connection, even right after a write
+primary_read_engine = _read_pool(_sqlite_read_only_url(DATABASE_URL) or DATABASE_URL)
+read_engine = _read_pool(READ_DATABASE_URL) if READ_DATABASE_URL else primary_read_engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+PrimaryReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=primary_read_engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 Base = declarative_base()
 
+# org_id -> monotonic time of its last write, oldest first
+_last_write: "OrderedDict[str, float]" = OrderedDict()
+_last_write_lock = threading.Lock()
+
+
+def mark_written(org_id: Optional[str]):
+    """Pin the org's reads to the primary for READ_AFTER_WRITE_SECONDS."""
+    if not org_id:
+        return
+    now = time.monotonic()
+    with _last_write_lock:
+        _last_write[org_id] = now
+        _last_write.move_to_end(org_id)
+        # Expired entries sit at the front; drop them so the map stays small
+        while _last_write:
+            oldest, written = next(iter(_last_write.items()))
+            if now - written < READ_AFTER_WRITE_SECONDS:
+                break
+            del _last_write[oldest]
+
+
+def read_session(org_id: Optional[str] = None):
+    """A read Session, from the primary if the org wrote recently."""
+    written = _last_write.get(org_id) if org_id else None
+    if written is not None and time.monotonic() - written < READ_AFTER_WRITE_SECONDS:
+        return PrimaryReadSessionLocal()
+    return ReadSessionLocal()
+
 
 # Dependency to get DB session
 def get_db():
@@ -17,3 +101,4 @@ def get_db():
         yield db
     finally:
         db.close()
+
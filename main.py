@@ -150,15 +150,28 @@
 
 
 from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy.orm import Session
-from models import User, UserDB
-from database import engine, Base, get_db
+from models import User, BenchmarkRequest, MultiGetRequest, RefactorJobRequest
+from database import engine, Base
+from storage import StorageBackend, get_read_storage, get_storage, open_storage
 from utils import generate_org_id, generate_api_key
+from negotiation import CompressionMiddleware, MessagePackMiddleware
 
 Base.metadata.create_all(bind=engine)  # Create DB tables
 
 app = FastAPI(title="FastAPI Code Generator with SQLAlchemy")
 
+# Outermost last: MessagePack transcoding happens before compression
+app.add_middleware(MessagePackMiddleware)
+app.add_middleware(CompressionMiddleware)
+
+
+@app.on_event("startup")
+def backfill_org_stats():
+    # Once per database: only runs while org_user_counters is still empty
+    with open_storage() as storage:
+        storage.backfill_stats()
+
+
 # ✅ Create organization (still in-memory, optional for API key generation)
 db_orgs = {}
 
@@ -178,47 +191,83 @@ def generate_org(name: str):
 
 
 @app.post("/api/org/{org_id}/users/")
-def create_user(org_id: str, user: User, db: Session = Depends(get_db)):
-    user_db = UserDB(**user.dict())
-    db.add(user_db)
+def create_user(
+    org_id: str, user: User, storage: StorageBackend = Depends(get_storage)
+):
     try:
-        db.commit()
-        db.refresh(user_db)
+        created = storage.create(user)
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
-    return {"message": "User created", "user": user_db}
+    return {"message": "User created", "user": created}
 
 
 @app.get("/api/org/{org_id}/users/{org_user_id}")
-def get_user(org_id: str, org_user_id: str, db: Session = Depends(get_db)):
-    user = db.query(UserDB).filter_by(org_user_id=org_user_id, org_id=org_id).first()
+def get_user(
+    org_id: str, org_user_id: str, storage: StorageBackend = Depends(get_read_storage)
+):
+    user = storage.get(org_id, org_user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 
+MAX_MULTI_GET_IDS = 5000
+
+
+@app.post("/api/org/{org_id}/users/multi_get")
+def get_users(
+    org_id: str,
+    request: MultiGetRequest,
+    storage: StorageBackend = Depends(get_read_storage),
+):
+    """
+    Resolves many users in one call with chunked IN queries. Duplicate ids
+    are collapsed; ``found`` keeps request order.
+    """
+    org_user_ids = list(dict.fromkeys(request.org_user_ids))
+    if len(org_user_ids) > MAX_MULTI_GET_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_MULTI_GET_IDS} org_user_ids per request",
+        )
+    users = storage.get_many(org_id, org_user_ids)
+    return {
+        "found": [users[i] for i in org_user_ids if i in users],
+        "missing": [i for i in org_user_ids if i not in users],
+    }
+
+
+@app.get("/api/org/{org_id}/stats")
+def get_org_stats(org_id: str, storage: StorageBackend = Depends(get_read_storage)):
+    """
+    Total users, users expiring in the next 7/30 days and users created in
+    the last 7/30 days, read from incrementally maintained counters.
+    """
+    return {"org_id": org_id, **storage.org_stats(org_id)}
+
+
 @app.put("/api/org/{org_id}/users/{org_user_id}")
 def update_user(
-    org_id: str, org_user_id: str, updated_user: User, db: Session = Depends(get_db)
+    org_id: str,
+    org_user_id: str,
+    updated_user: User,
+    storage: StorageBackend = Depends(get_storage),
 ):
-    user = db.query(UserDB).filter_by(org_user_id=org_user_id, org_id=org_id).first()
+    try:
+        user = storage.update(org_id, org_user_id, updated_user)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    for key, value in updated_user.dict().items():
-        setattr(user, key, value)
-    db.commit()
-    db.refresh(user)
     return {"message": "User updated", "user": user}
 
 
 @app.delete("/api/org/{org_id}/users/{org_user_id}")
-def delete_user(org_id: str, org_user_id: str, db: Session = Depends(get_db)):
-    user = db.query(UserDB).filter_by(org_user_id=org_user_id, org_id=org_id).first()
-    if not user:
+def delete_user(
+    org_id: str, org_user_id: str, storage: StorageBackend = Depends(get_storage)
+):
+    if not storage.delete(org_id, org_user_id):
         raise HTTPException(status_code=404, detail="User not found")
-    db.delete(user)
-    db.commit()
     return {"message": "User deleted"}
 
 
@@ -243,16 +292,12 @@ def login(org_id: str, role: str = "user"):
 def create_user(
     org_id: str,
     user: User,
-    db: Session = Depends(get_db),
+    storage: StorageBackend = Depends(get_storage),
     token_data: dict = Depends(verify_token),
 ):
     if token_data["org_id"] != org_id or token_data["role"] != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
-    user_db = UserDB(**user.dict())
-    db.add(user_db)
-    db.commit()
-    db.refresh(user_db)
-    return {"message": "User created", "user": user_db}
+    return {"message": "User created", "user": storage.create(user)}
 
 
 # -------------------
@@ -263,6 +308,8 @@ def generate_sample_code(org_id: str, org_name: str):
     """
     Returns a sample FastAPI CRUD Python code template for the given org.
     """
+    # Values go in as repr() literals so no org_id/org_name can escape its string
+    base_url = f"/api/org/{org_id}/users/"
     sample_code = f"""
 from fastapi import FastAPI, HTTPException, Depends
 from pydantic import BaseModel
@@ -272,11 +319,11 @@ from models import User, UserDB
 from auth import create_access_token, verify_token
 
 Base.metadata.create_all(bind=engine)
-app = FastAPI(title="{org_name} CRUD API")
+app = FastAPI(title={org_name + ' CRUD API'!r})
 
-@app.post("/api/org/{org_id}/users/")
+@app.post({base_url!r})
 def create_user(user: User, db: Session = Depends(get_db), token_data: dict = Depends(verify_token)):
-    if token_data["org_id"] != "{org_id}" or token_data["role"] != "admin":
+    if token_data["org_id"] != {org_id!r} or token_data["role"] != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     user_db = UserDB(**user.dict())
     db.add(user_db)
@@ -284,11 +331,143 @@ def create_user(user: User, db: Session = Depends(get_db), token_data: dict = De
     db.refresh(user_db)
     return user_db
 
-@app.get("/api/org/{org_id}/users/{{user_id}}")
+@app.get({base_url + '{user_id}'!r})
 def get_user(user_id: str, db: Session = Depends(get_db)):
-    user = db.query(UserDB).filter_by(org_user_id=user_id, org_id="{org_id}").first()
+    user = db.query(UserDB).filter_by(org_user_id=user_id, org_id={org_id!r}).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 """
     return {"generated_code": sample_code}
+
+
+# -------------------
+# Benchmark Generated Code (for Streamlit)
+# -------------------
+from benchmark import BenchmarkError, benchmark_generated_code
+
+
+@app.post("/benchmark_code")
+def benchmark_code(request: BenchmarkRequest, token_data: dict = Depends(verify_token)):
+    """
+    Regenerates the org's code server-side, mounts it against a throwaway
+    in-memory SQLite DB and returns a latency/throughput report for a fixed
+    CRUD workload. Admins of the org only.
+    """
+    if token_data["org_id"] != request.org_id or token_data["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    code = generate_sample_code(request.org_id, request.org_name)["generated_code"]
+    try:
+        report = benchmark_generated_code(code, request.org_id, request.iterations)
+    except BenchmarkError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"report": report}
+
+
+# -------------------
+# AI Refactoring Jobs (for Streamlit)
+# -------------------
+import json
+from fastapi.responses import StreamingResponse
+from ai_jobs import QueueFullError, get_job_queue
+
+
+def _get_job(job_id: str):
+    job = get_job_queue().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/ai/refactor_jobs", status_code=202)
+def submit_refactor_job(request: RefactorJobRequest):
+    """
+    Queues AI analysis of the code. Identical code maps to the same job, so
+    repeat submissions return the cached or in-flight result.
+    """
+    try:
+        job = get_job_queue().submit(request.code)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return job.to_dict()
+
+
+@app.get("/ai/refactor_jobs/{job_id}")
+async def get_refactor_job(job_id: str, wait: float = 0):
+    """Job status and result; ``wait`` long-polls up to 30s for completion."""
+    job = _get_job(job_id)
+    if wait > 0:
+        await job.wait(min(wait, 30))
+    return job.to_dict()
+
+
+@app.get("/ai/refactor_jobs/{job_id}/events")
+async def stream_refactor_job(job_id: str):
+    """Server-sent events: the pending status, then the final job once done."""
+    job = _get_job(job_id)
+
+    async def events():
+        if not job.finished.done():
+            yield f"event: status\ndata: {json.dumps(job.to_dict())}\n\n"
+        while not await job.wait(15):
+            yield ": keep-alive\n\n"
+        yield f"event: {job.status}\ndata: {json.dumps(job.to_dict())}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# -------------------
+# Change Feed (reads the user_changes outbox)
+# -------------------
+from typing import Optional
+from fastapi import Header, Request, WebSocket, WebSocketDisconnect
+from change_feed import get_hub
+
+
+@app.get("/api/org/{org_id}/changes")
+async def stream_changes(
+    org_id: str,
+    request: Request,
+    cursor: Optional[int] = None,
+    last_event_id: Optional[int] = Header(None),
+):
+    """
+    Server-sent events for every insert, update and delete in the org. Each
+    event id is a cursor: reconnect with ``Last-Event-ID`` (or ``?cursor=``)
+    to resume. Without one the stream starts at the latest change;
+    ``cursor=0`` replays everything retained.
+    """
+    start = last_event_id if last_event_id is not None else cursor
+
+    async def events():
+        batches = get_hub().batches(org_id, start)
+        try:
+            async for batch in batches:
+                if await request.is_disconnected():
+                    break
+                if not batch:
+                    yield ": keep-alive\n\n"
+                for change in batch:
+                    yield f"id: {change['id']}\nevent: {change['op']}\ndata: {json.dumps(change)}\n\n"
+        finally:
+            await batches.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.websocket("/api/org/{org_id}/changes/ws")
+async def websocket_changes(websocket: WebSocket, org_id: str, cursor: Optional[int] = None):
+    """The same change feed as JSON messages over a WebSocket."""
+    await websocket.accept()
+    batches = get_hub().batches(org_id, cursor)
+    try:
+        async for batch in batches:
+            if not batch:
+                # Also how a quiet feed notices the client went away
+                await websocket.send_json({"op": "keep-alive"})
+            for change in batch:
+                await websocket.send_json(change)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await batches.aclose()
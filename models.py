@@ -1,8 +1,9 @@
-from sqlalchemy import Column, String, DateTime
+from sqlalchemy import Column, String, DateTime, Integer, Text, Index
 from sqlalchemy.orm import relationship
-from datetime import datetime
+from datetime import datetime, timezone
 from database import Base
-from pydantic import BaseModel
+from typing import List
+from pydantic import BaseModel, Field, validator
 
 
 # SQLAlchemy User model
@@ -18,6 +19,32 @@ class UserDB(Base):
     valid_till = Column(DateTime)
 
 
+# Per-org user counters, maintained by the storage backend (see counters.py)
+class OrgUserCounterDB(Base):
+    __tablename__ = "org_user_counters"
+
+    org_id = Column(String, primary_key=True)
+    metric = Column(String, primary_key=True)  # "total", "created" or "valid_till"
+    day = Column(Integer, primary_key=True)  # date.toordinal(); 0 for "total"
+    count = Column(Integer, nullable=False, default=0)
+
+
+# Transactional outbox of user mutations; id is the change-feed cursor
+class UserChangeDB(Base):
+    __tablename__ = "user_changes"
+    __table_args__ = (
+        Index("ix_user_changes_org_id_id", "org_id", "id"),
+        {"sqlite_autoincrement": True},  # never reuse ids, even after pruning
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    org_id = Column(String, nullable=False)
+    org_user_id = Column(String, nullable=False)
+    op = Column(String, nullable=False)  # "insert", "update" or "delete"
+    payload = Column(Text)  # user as JSON; NULL for deletes
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
 # Pydantic model for request/response
 class User(BaseModel):
     org_user_id: str
@@ -30,3 +57,27 @@ class User(BaseModel):
 
     class Config:
         orm_mode = True  # Enable ORM parsing
+
+    @validator("created_date", "valid_till")
+    def to_naive_utc(cls, value):
+        # SQLite drops the offset, so store (and count) every timestamp as naive UTC
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
+# Request body for /api/org/{org_id}/users/multi_get
+class MultiGetRequest(BaseModel):
+    org_user_ids: List[str]
+
+
+# Request body for /benchmark_code
+class BenchmarkRequest(BaseModel):
+    org_id: str
+    org_name: str
+    iterations: int = Field(50, ge=1, le=1000)
+
+
+# Request body for /ai/refactor_jobs
+class RefactorJobRequest(BaseModel):
+    code: str
@@ -0,0 +1,238 @@
+"""
+Content negotiation middleware: response compression and MessagePack.
+
+CompressionMiddleware compresses responses of at least ``minimum_size``
+bytes with zstd or gzip, whichever the client's Accept-Encoding prefers.
+zstd needs the ``zstandard`` package. Streaming responses such as
+the SSE change feed are passed through as they are.
+
+MessagePackMiddleware lets the user endpoints (/api/org/...) take
+``Content-Type: application/msgpack`` request bodies and return MessagePack
+when ``Accept`` prefers it. It needs the ``msgpack`` package. The
+endpoints keep producing JSON; bodies are transcoded at the edge.
+"""
+
+import gzip
+import json
+import os
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+MSGPACK_TYPE = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+_COMPRESSIBLE = ("application/json", "application/javascript", "text/") + MSGPACK_TYPES
+
+
+def _preferences(header: str) -> Dict[str, float]:
+    """Parse an Accept or Accept-Encoding header into {token: q}."""
+    prefs = {}
+    for part in header.split(","):
+        token, _, params = part.partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        prefs[token] = q
+    return prefs
+
+
+def available_encodings():
+    return ("zstd", "gzip") if zstandard else ("gzip",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported content-coding for the header; zstd wins ties."""
+    prefs = _preferences(accept_encoding)
+    best, best_q = None, 0.0
+    for encoding in available_encodings():
+        q = prefs.get(encoding, prefs.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _is_compressible(content_type: str) -> bool:
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type == "text/event-stream":
+        return False
+    return content_type.startswith(_COMPRESSIBLE)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            compressible = _is_compressible(headers.get("content-type", ""))
+            if compressible:
+                headers.add_vary_header("Accept-Encoding")
+            if (
+                not compressible
+                or message.get("more_body", False)  # streaming: leave as is
+                or "content-encoding" in headers
+                or len(body) < self.minimum_size
+            ):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _json_default(value):
+    if msgpack is not None and isinstance(value, msgpack.Timestamp):
+        return value.to_datetime().isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def msgpack_to_json(body: bytes) -> bytes:
+    return json.dumps(msgpack.unpackb(body), default=_json_default).encode()
+
+
+def json_to_msgpack(body: bytes) -> bytes:
+    return msgpack.packb(json.loads(body))
+
+
+def prefers_msgpack(accept: str) -> bool:
+    prefs = _preferences(accept)
+    q = max(prefs.get(t, 0.0) for t in MSGPACK_TYPES)
+    return q > 0 and q >= prefs.get("application/json", prefs.get("*/*", 0.0))
+
+
+class MessagePackMiddleware:
+    def __init__(self, app, path_prefix: str = "/api/org/"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+
+        if content_type in MSGPACK_TYPES:
+            if msgpack is None:
+                response = JSONResponse(
+                    {"detail": "MessagePack is not supported by this server"},
+                    status_code=415,
+                )
+                await response(scope, receive, send)
+                return
+            body = b""
+            while True:
+                message = await receive()
+                body += message.get("body", b"")
+                if not message.get("more_body", False):
+                    break
+            try:
+                body = msgpack_to_json(body)
+            except Exception:
+                response = JSONResponse({"detail": "Invalid MessagePack body"}, status_code=400)
+                await response(scope, receive, send)
+                return
+            scope = dict(scope)
+            scope["headers"] = [
+                (k, v) for k, v in scope["headers"] if k not in (b"content-type", b"content-length")
+            ] + [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+            sent = False
+
+            async def replay_body():
+                nonlocal sent
+                if sent:
+                    return {"type": "http.disconnect"}
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+
+            receive = replay_body
+
+        if msgpack is None or not prefers_msgpack(headers.get("accept", "")):
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+        chunks = []
+
+        async def send_msgpack(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+            response_headers = MutableHeaders(raw=start["headers"])
+            response_headers.add_vary_header("Accept")
+            if not response_headers.get("content-type", "").startswith("application/json"):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = json_to_msgpack(b"".join(chunks))
+            response_headers["Content-Type"] = MSGPACK_TYPE
+            response_headers["Content-Length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_msgpack)
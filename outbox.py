@@ -0,0 +1,133 @@
+"""
+Transactional outbox of user mutations, read by the per-org change feed.
+
+The SQLAlchemy backend adds a ``user_changes`` row in the same transaction
+as each insert, update or delete. The row id is the feed cursor, so a
+consumer resumes with the last id it processed. The memory backend keeps a
+bounded in-process equivalent.
+
+Old rows are pruned with:
+
+    python outbox.py prune --keep-days 7
+"""
+
+import argparse
+import json
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import User, UserChangeDB
+
+INSERT, UPDATE, DELETE = "insert", "update", "delete"
+
+USER_FIELDS = tuple(User.__fields__)
+
+
+def user_payload(user) -> Optional[dict]:
+    """JSON-ready fields of anything carrying the user fields as attributes."""
+    if user is None:
+        return None
+    payload = {name: getattr(user, name) for name in USER_FIELDS}
+    payload["created_date"] = payload["created_date"].isoformat()
+    payload["valid_till"] = payload["valid_till"].isoformat()
+    return payload
+
+
+def encode_user(user) -> Optional[str]:
+    if user is None:
+        return None
+    return json.dumps(user_payload(user))
+
+
+def change_event(
+    change_id: int, org_user_id: str, op: str, user: Optional[dict], created_at: datetime
+) -> dict:
+    return {
+        "id": change_id,
+        "op": op,
+        "org_user_id": org_user_id,
+        "user": user,
+        "created_at": created_at.isoformat() if created_at else None,
+    }
+
+
+def update_changes(org_id: str, org_user_id: str, user) -> list:
+    """
+    (org_id, org_user_id, op, user) changes for replacing a user with ``user``.
+    A re-keyed user (new org_id or org_user_id) is a delete under the old key
+    and an insert under the new one, so each org's feed sees it.
+    """
+    if (user.org_id, user.org_user_id) == (org_id, org_user_id):
+        return [(org_id, org_user_id, UPDATE, user)]
+    return [
+        (org_id, org_user_id, DELETE, None),
+        (user.org_id, user.org_user_id, INSERT, user),
+    ]
+
+
+def record_change(db: Session, org_id: str, org_user_id: str, op: str, user=None):
+    """Stage an outbox row; the caller commits it with the mutation."""
+    db.add(
+        UserChangeDB(
+            org_id=org_id, org_user_id=org_user_id, op=op, payload=encode_user(user)
+        )
+    )
+
+
+def changes_since(db: Session, org_id: str, cursor: int, limit: int = 500) -> List[dict]:
+    rows = (
+        db.query(UserChangeDB)
+        .filter(UserChangeDB.org_id == org_id, UserChangeDB.id > cursor)
+        .order_by(UserChangeDB.id)
+        .limit(limit)
+        .all()
+    )
+    return [
+        change_event(
+            r.id, r.org_user_id, r.op, json.loads(r.payload) if r.payload else None, r.created_at
+        )
+        for r in rows
+    ]
+
+
+def latest_change_id(db: Session, org_id: str) -> int:
+    return (
+        db.query(func.max(UserChangeDB.id)).filter(UserChangeDB.org_id == org_id).scalar()
+        or 0
+    )
+
+
+def prune(db: Session, keep_days: int) -> int:
+    """Delete changes older than ``keep_days``. Commits; returns rows deleted."""
+    cutoff = datetime.utcnow() - timedelta(days=keep_days)
+    deleted = (
+        db.query(UserChangeDB)
+        .filter(UserChangeDB.created_at < cutoff)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
+
+
+def main(argv: Optional[List[str]] = None):
+    from database import Base, SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="User change outbox")
+    commands = parser.add_subparsers(dest="command", required=True)
+    prune_cmd = commands.add_parser("prune", help="delete old changes")
+    prune_cmd.add_argument("--keep-days", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        print({"deleted": prune(db, args.keep_days)})
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Durable persistence for the in-memory storage backend.
+
+A data directory holds numbered generations:
+
+    snapshot-00000003.bin   every user as of the start of generation 3
+    wal-00000003.log        mutations made since that snapshot
+
+Every mutation is appended to the current write-ahead log (WAL) before it is
+applied. The log is fsynced once per ``fsync_batch`` appends. Taking a
+snapshot opens the next generation's log first, then writes the snapshot
+beside it and deletes older generations. Startup memory-maps the newest
+valid snapshot and replays only the logs from its generation onward. A torn
+record at the end of the last log (crash mid-write) is truncated away. If
+those logs do not cover every generation since that snapshot (e.g. the
+newest snapshot is corrupt and the logs before it were already deleted),
+recovery raises RecoveryError instead of starting with data missing.
+
+Records are packed binary: five length-prefixed UTF-8 strings and two
+int64 microsecond timestamps since the epoch, read back as naive datetimes.
+Aware datetimes are converted to UTC before encoding.
+"""
+
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+
+STRING_FIELDS = ("org_user_id", "org_id", "name", "contact_no", "employee_code")
+DATETIME_FIELDS = ("created_date", "valid_till")
+
+_RECORD = struct.Struct("<5H2q")  # string lengths, then both timestamps
+_FRAME = struct.Struct("<II")  # payload length, crc32 of payload
+_ID = struct.Struct("<H")
+_SNAPSHOT_HEADER = struct.Struct("<8sQQ")  # magic, generation, record count
+_CRC = struct.Struct("<I")
+SNAPSHOT_MAGIC = b"APIGSNP1"
+
+OP_PUT = b"P"
+OP_UPDATE = b"U"  # old org_user_id, then the new record (may be re-keyed)
+OP_DELETE = b"D"
+
+_EPOCH = datetime(1970, 1, 1)
+_FILE = re.compile(r"^(snapshot|wal)-(\d{8})\.(bin|log)$")
+
+
+def _micros(value: datetime) -> int:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def encode_record(record) -> bytes:
+    strings = [getattr(record, name).encode() for name in STRING_FIELDS]
+    head = _RECORD.pack(
+        *(len(s) for s in strings),
+        *(_micros(getattr(record, name)) for name in DATETIME_FIELDS),
+    )
+    return head + b"".join(strings)
+
+
+def decode_record(buf, offset: int):
+    """Returns (fields dict, offset just past the record)."""
+    # Unrolled on purpose: this runs once per user on every startup.
+    l0, l1, l2, l3, l4, created, valid = _RECORD.unpack_from(buf, offset)
+    o0 = offset + _RECORD.size
+    o1 = o0 + l0
+    o2 = o1 + l1
+    o3 = o2 + l2
+    o4 = o3 + l3
+    end = o4 + l4
+    fields = {
+        "org_user_id": str(buf[o0:o1], "utf-8"),
+        "org_id": str(buf[o1:o2], "utf-8"),
+        "name": str(buf[o2:o3], "utf-8"),
+        "contact_no": str(buf[o3:o4], "utf-8"),
+        "employee_code": str(buf[o4:end], "utf-8"),
+        "created_date": _EPOCH + timedelta(microseconds=created),
+        "valid_till": _EPOCH + timedelta(microseconds=valid),
+    }
+    return fields, end
+
+
+class RecoveryError(Exception):
+    """The data directory cannot be restored without losing data."""
+
+
+class Journal:
+    """Owns the files of one data directory. Callers serialize mutations."""
+
+    def __init__(self, directory: str, fsync_batch: int = 64):
+        """``fsync_batch``: 1 fsyncs every append, 0 leaves flushing to the OS."""
+        self.directory = directory
+        self.fsync_batch = fsync_batch
+        self.generation = 0
+        self._fd = None
+        self._pending = 0
+        self._snapshot_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, kind: str, generation: int) -> str:
+        ext = "bin" if kind == "snapshot" else "log"
+        return os.path.join(self.directory, f"{kind}-{generation:08d}.{ext}")
+
+    def _generations(self, kind: str):
+        found = []
+        for name in os.listdir(self.directory):
+            match = _FILE.match(name)
+            if match and match.group(1) == kind:
+                found.append(int(match.group(2)))
+        return sorted(found)
+
+    # ---- recovery ----
+
+    def _load_snapshot(self, generation: int, apply) -> int:
+        with open(self._path("snapshot", generation), "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, snap_generation, count = _SNAPSHOT_HEADER.unpack_from(mm, 0)
+                if magic != SNAPSHOT_MAGIC or snap_generation != generation:
+                    raise ValueError("bad snapshot header")
+                end = len(mm) - _CRC.size
+                body = memoryview(mm)[_SNAPSHOT_HEADER.size : end]
+                try:
+                    (crc,) = _CRC.unpack_from(mm, end)
+                    if zlib.crc32(body) != crc:
+                        raise ValueError("snapshot checksum mismatch")
+                finally:
+                    body.release()
+                offset = _SNAPSHOT_HEADER.size
+                for _ in range(count):
+                    fields, offset = decode_record(mm, offset)
+                    apply(OP_PUT, None, fields)
+        return count
+
+    def _replay(self, generation: int, apply, truncate: bool) -> int:
+        path = self._path("wal", generation)
+        with open(path, "rb") as f:
+            data = f.read()
+        offset = replayed = 0
+        while offset + _FRAME.size <= len(data):
+            length, crc = _FRAME.unpack_from(data, offset)
+            start, end = offset + _FRAME.size, offset + _FRAME.size + length
+            payload = data[start:end]
+            if end > len(data) or zlib.crc32(payload) != crc:
+                break  # torn write at the tail
+            op, old_id = payload[:1], None
+            pos = 1
+            if op in (OP_UPDATE, OP_DELETE):
+                (id_len,) = _ID.unpack_from(payload, pos)
+                pos += _ID.size
+                old_id = payload[pos : pos + id_len].decode()
+                pos += id_len
+            fields = decode_record(payload, pos)[0] if op != OP_DELETE else None
+            apply(op, old_id, fields)
+            offset = end
+            replayed += 1
+        if offset < len(data) and truncate:
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+        return replayed
+
+    def recover(self, apply) -> dict:
+        """
+        Rebuild state through ``apply(op, old_id, fields)`` and open the
+        newest log for appending. Returns counts for logging/benchmarks.
+        """
+        snapshot_records, base, source = 0, 0, "an empty store"
+        for generation in reversed(self._generations("snapshot")):
+            try:
+                snapshot_records = self._load_snapshot(generation, apply)
+                base, source = generation, f"snapshot {generation}"
+                break
+            except (ValueError, struct.error):
+                continue  # half-written or corrupt: fall back to an older one
+        logs = [g for g in self._generations("wal") if g >= base]
+        if logs != list(range(base, base + len(logs))):
+            raise RecoveryError(
+                f"{self.directory}: logs {logs} do not continue from {source}; "
+                "refusing to start with missing data"
+            )
+        replayed = 0
+        for generation in logs:
+            replayed += self._replay(generation, apply, truncate=generation == logs[-1])
+        self.generation = logs[-1] if logs else base
+        self._fd = os.open(
+            self._path("wal", self.generation), os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        )
+        return {
+            "generation": self.generation,
+            "snapshot_records": snapshot_records,
+            "replayed": replayed,
+        }
+
+    # ---- logging ----
+
+    def _append(self, payload: bytes):
+        os.write(self._fd, _FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._pending += 1
+        if self.fsync_batch and self._pending >= self.fsync_batch:
+            self.flush()
+
+    def log_put(self, record):
+        self._append(OP_PUT + encode_record(record))
+
+    def log_update(self, old_id: str, record):
+        raw = old_id.encode()
+        self._append(OP_UPDATE + _ID.pack(len(raw)) + raw + encode_record(record))
+
+    def log_delete(self, org_user_id: str):
+        raw = org_user_id.encode()
+        self._append(OP_DELETE + _ID.pack(len(raw)) + raw)
+
+    def flush(self):
+        if self._fd is not None and self._pending:
+            os.fsync(self._fd)
+        self._pending = 0
+
+    # ---- snapshots ----
+
+    def rotate(self) -> int:
+        """Start the next log generation. Call while mutations are blocked."""
+        self.flush()
+        os.close(self._fd)
+        self.generation += 1
+        self._fd = os.open(
+            self._path("wal", self.generation), os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        )
+        return self.generation
+
+    def write_snapshot(self, generation: int, records):
+        """Persist ``records`` (the state at the start of ``generation``)."""
+        with self._snapshot_lock:
+            path = self._path("snapshot", generation)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation, len(records)))
+                crc = 0
+                chunk = []
+                for i, record in enumerate(records, 1):
+                    chunk.append(encode_record(record))
+                    if i % 10_000 == 0:
+                        data = b"".join(chunk)
+                        crc = zlib.crc32(data, crc)
+                        f.write(data)
+                        chunk = []
+                data = b"".join(chunk)
+                f.write(data)
+                f.write(_CRC.pack(zlib.crc32(data, crc)))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            dir_fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+            for kind in ("snapshot", "wal"):
+                for old in self._generations(kind):
+                    if old < generation:
+                        os.remove(self._path(kind, old))
+
+    def close(self):
+        if self._fd is not None:
+            self.flush()
+            os.close(self._fd)
+            self._fd = None
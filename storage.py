@@ -1,10 +1,476 @@
 # storage.py
-from typing import Dict
-from models import User
+"""
+Pluggable user storage.
 
-# Structure: { org_id: { org_user_id: User } }
-db: Dict[str, Dict[str, User]] = {}
+STORAGE_BACKEND=sqlalchemy (default) keeps users in the SQL database from
+database.py. STORAGE_BACKEND=memory keeps them in a compact in-process store
+for ephemeral and test deployments where SQLite I/O is the bottleneck. Set
+MEMORY_STORAGE_DIR to make it durable with an append-only log and periodic
+snapshots (see persistence.py); otherwise data is lost on restart.
+"""
+import atexit
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Set
 
-# # Store API keys per organization
-# # Structure: { org_id: api_key }
-# api_keys: Dict[str, str] = {}
+from fastapi import Request
+from sqlalchemy.orm import Session
+
+import counters
+import outbox
+from database import SessionLocal, mark_written, read_session
+from models import User, UserDB
+from persistence import OP_PUT, OP_UPDATE, Journal
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlalchemy")
+if STORAGE_BACKEND not in ("sqlalchemy", "memory"):
+    raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}")
+
+# Durability of the memory backend
+MEMORY_STORAGE_DIR = os.getenv("MEMORY_STORAGE_DIR")  # unset: not persisted
+MEMORY_FSYNC_BATCH = int(os.getenv("MEMORY_FSYNC_BATCH", "64"))
+MEMORY_SNAPSHOT_EVERY = int(os.getenv("MEMORY_SNAPSHOT_EVERY", "100000"))
+
+USER_FIELDS = tuple(User.__fields__)
+
+# Ids per IN (...) query; stays under SQLite's bound-parameter limit
+MULTI_GET_CHUNK = 500
+
+# Changes the memory backend keeps for its change feed, across all orgs
+MEMORY_CHANGE_RETENTION = int(os.getenv("MEMORY_CHANGE_RETENTION", "100000"))
+
+
+def _to_user(obj) -> User:
+    """Build a User from any object carrying the user fields as attributes."""
+    return User(**{name: getattr(obj, name) for name in USER_FIELDS})
+
+
+class StorageBackend:
+    """Interface every user store implements. All lookups are scoped to an org."""
+
+    def create(self, user: User) -> User:
+        """Insert a user; raises if ``org_user_id`` already exists."""
+        raise NotImplementedError
+
+    def get(self, org_id: str, org_user_id: str) -> Optional[User]:
+        raise NotImplementedError
+
+    def get_many(self, org_id: str, org_user_ids: List[str]) -> Dict[str, User]:
+        """Users found among ``org_user_ids``, keyed by id. Missing ids are absent."""
+        raise NotImplementedError
+
+    def update(self, org_id: str, org_user_id: str, user: User) -> Optional[User]:
+        """
+        Replace every field of a user; returns None if it does not exist.
+        Raises if the new ``org_user_id`` belongs to another user.
+        """
+        raise NotImplementedError
+
+    def delete(self, org_id: str, org_user_id: str) -> bool:
+        raise NotImplementedError
+
+    def org_stats(self, org_id: str, now: Optional[datetime] = None) -> dict:
+        """Total users, users expiring and users created in 7/30 day windows."""
+        raise NotImplementedError
+
+    def reconcile_stats(self, org_id: Optional[str] = None) -> dict:
+        """Recompute the counters behind org_stats from the users themselves."""
+        raise NotImplementedError
+
+    def backfill_stats(self) -> Optional[dict]:
+        """Build the counters if they never were; None when there was nothing to do."""
+        raise NotImplementedError
+
+    def changes_since(self, org_id: str, cursor: int, limit: int = 500) -> List[dict]:
+        """The org's change-feed events with id > ``cursor``, oldest first."""
+        raise NotImplementedError
+
+    def latest_change_id(self, org_id: str) -> int:
+        raise NotImplementedError
+
+
+class SQLAlchemyStorage(StorageBackend):
+    """Users stored in the ``users`` table, one Session per request."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _row(self, org_id: str, org_user_id: str) -> Optional[UserDB]:
+        return (
+            self.db.query(UserDB)
+            .filter_by(org_user_id=org_user_id, org_id=org_id)
+            .first()
+        )
+
+    def create(self, user: User) -> User:
+        row = UserDB(**user.dict())
+        try:
+            self.db.add(row)
+            counters.apply_deltas(self.db, counters.user_deltas(user, 1))
+            outbox.record_change(self.db, user.org_id, user.org_user_id, outbox.INSERT, user)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        self.db.refresh(row)
+        return _to_user(row)
+
+    def get(self, org_id: str, org_user_id: str) -> Optional[User]:
+        row = self._row(org_id, org_user_id)
+        return _to_user(row) if row else None
+
+    def get_many(self, org_id: str, org_user_ids: List[str]) -> Dict[str, User]:
+        found = {}
+        for start in range(0, len(org_user_ids), MULTI_GET_CHUNK):
+            chunk = org_user_ids[start : start + MULTI_GET_CHUNK]
+            rows = (
+                self.db.query(UserDB)
+                .filter(UserDB.org_id == org_id, UserDB.org_user_id.in_(chunk))
+                .all()
+            )
+            for row in rows:
+                found[row.org_user_id] = _to_user(row)
+        return found
+
+    def update(self, org_id: str, org_user_id: str, user: User) -> Optional[User]:
+        row = self._row(org_id, org_user_id)
+        if not row:
+            return None
+        try:
+            deltas = counters.user_deltas(row, -1)
+            for key, value in user.dict().items():
+                setattr(row, key, value)
+            counters.apply_deltas(self.db, counters.user_deltas(row, 1, deltas))
+            for change in outbox.update_changes(org_id, org_user_id, user):
+                outbox.record_change(self.db, *change)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        self.db.refresh(row)
+        return _to_user(row)
+
+    def delete(self, org_id: str, org_user_id: str) -> bool:
+        row = self._row(org_id, org_user_id)
+        if not row:
+            return False
+        try:
+            self.db.delete(row)
+            counters.apply_deltas(self.db, counters.user_deltas(row, -1))
+            outbox.record_change(self.db, org_id, org_user_id, outbox.DELETE)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return True
+
+    def org_stats(self, org_id: str, now: Optional[datetime] = None) -> dict:
+        return counters.org_stats(self.db, org_id, now)
+
+    def reconcile_stats(self, org_id: Optional[str] = None) -> dict:
+        return counters.reconcile(self.db, org_id)
+
+    def backfill_stats(self) -> Optional[dict]:
+        return counters.backfill(self.db)
+
+    def changes_since(self, org_id: str, cursor: int, limit: int = 500) -> List[dict]:
+        return outbox.changes_since(self.db, org_id, cursor, limit)
+
+    def latest_change_id(self, org_id: str) -> int:
+        return outbox.latest_change_id(self.db, org_id)
+
+
+class UserRecord:
+    """Slotted user row: no per-instance __dict__ or validator state, unlike a User."""
+
+    __slots__ = USER_FIELDS
+
+    def __init__(
+        self,
+        org_user_id,
+        org_id,
+        name,
+        contact_no,
+        employee_code,
+        created_date,
+        valid_till,
+    ):
+        self.org_user_id = org_user_id
+        self.org_id = org_id
+        self.name = name
+        self.contact_no = contact_no
+        self.employee_code = employee_code
+        self.created_date = created_date
+        self.valid_till = valid_till
+
+
+class InMemoryStorage(StorageBackend):
+    """
+    Process-local store. ``org_user_id`` is globally unique, like the primary
+    key of ``users``, and each org keeps an index of its own ids.
+
+    With a ``journal`` every mutation is logged before it is applied, and a
+    snapshot is taken in the background after ``snapshot_every`` mutations.
+
+    The change feed keeps the last ``change_retention`` changes across all
+    orgs and is not journaled. A change references the (immutable) record
+    rather than a copy of it. Change ids start from the process start time
+    in microseconds, so cursors keep increasing across restarts.
+    """
+
+    def __init__(
+        self,
+        journal: Optional[Journal] = None,
+        snapshot_every: int = 0,
+        change_retention: int = MEMORY_CHANGE_RETENTION,
+    ):
+        self._users: Dict[str, UserRecord] = {}
+        self._orgs: Dict[str, Set[str]] = {}
+        self._counters: Counter = Counter()
+        # org_id -> deque of (change_id, org_user_id, op, record, unix time)
+        self._changes: Dict[str, deque] = {}
+        self._change_orgs: deque = deque()  # org_id of every retained change, oldest first
+        self._change_retention = change_retention
+        self._change_id = int(time.time() * 1_000_000)
+        self._lock = threading.Lock()
+        self._journal = journal
+        self._snapshot_every = snapshot_every
+        self._since_snapshot = 0
+        self._snapshotting = False
+        self.recovery = journal.recover(self._apply) if journal else None
+
+    def __len__(self):
+        return len(self._users)
+
+    def _record(self, org_id: str, org_user_id: str) -> Optional[UserRecord]:
+        record = self._users.get(org_user_id)
+        if record is None or record.org_id != org_id:
+            return None
+        return record
+
+    def _insert(self, record: UserRecord):
+        self._users[record.org_user_id] = record
+        self._orgs.setdefault(record.org_id, set()).add(record.org_user_id)
+        counters.user_deltas(record, 1, self._counters)
+
+    def _remove(self, record: UserRecord):
+        del self._users[record.org_user_id]
+        counters.user_deltas(record, -1, self._counters)
+        ids = self._orgs[record.org_id]
+        ids.discard(record.org_user_id)
+        if not ids:
+            del self._orgs[record.org_id]
+
+    def _apply(self, op: bytes, old_id: Optional[str], fields: Optional[dict]):
+        """Replay one journal entry."""
+        if old_id is not None and old_id in self._users:
+            self._remove(self._users[old_id])
+        if op in (OP_PUT, OP_UPDATE):
+            existing = self._users.get(fields["org_user_id"])
+            if existing is not None:
+                self._remove(existing)
+            self._insert(UserRecord(**fields))
+
+    def _record_change(self, org_id: str, org_user_id: str, op: str, record=None):
+        if not self._change_retention:
+            return
+        self._change_id += 1
+        changes = self._changes.get(org_id)
+        if changes is None:
+            changes = self._changes[org_id] = deque()
+        changes.append((self._change_id, org_user_id, op, record, time.time()))
+        self._change_orgs.append(org_id)
+        if len(self._change_orgs) > self._change_retention:
+            # The oldest change overall is the head of its org's deque
+            oldest_org = self._change_orgs.popleft()
+            oldest = self._changes[oldest_org]
+            oldest.popleft()
+            if not oldest:
+                del self._changes[oldest_org]
+
+    def _logged(self):
+        """Count a mutation; returns True when a snapshot is due."""
+        if not self._journal or not self._snapshot_every:
+            return False
+        self._since_snapshot += 1
+        if self._since_snapshot < self._snapshot_every or self._snapshotting:
+            return False
+        self._since_snapshot = 0
+        self._snapshotting = True
+        return True
+
+    def _maybe_snapshot(self, due: bool):
+        if due:
+            threading.Thread(target=self.snapshot, daemon=True).start()
+
+    def snapshot(self):
+        """Write a snapshot and drop older log generations."""
+        with self._lock:
+            records = list(self._users.values())  # records are never mutated in place
+            generation = self._journal.rotate()
+        try:
+            self._journal.write_snapshot(generation, records)
+        finally:
+            self._snapshotting = False
+
+    def close(self):
+        if self._journal:
+            with self._lock:
+                self._journal.close()
+
+    def create(self, user: User) -> User:
+        with self._lock:
+            if user.org_user_id in self._users:
+                raise ValueError(f"User {user.org_user_id!r} already exists")
+            record = UserRecord(**user.dict())
+            if self._journal:
+                self._journal.log_put(record)
+            self._insert(record)
+            self._record_change(user.org_id, user.org_user_id, outbox.INSERT, record)
+            due = self._logged()
+        self._maybe_snapshot(due)
+        return user
+
+    def get(self, org_id: str, org_user_id: str) -> Optional[User]:
+        record = self._record(org_id, org_user_id)
+        return _to_user(record) if record else None
+
+    def get_many(self, org_id: str, org_user_ids: List[str]) -> Dict[str, User]:
+        found = {}
+        for org_user_id in org_user_ids:
+            record = self._record(org_id, org_user_id)
+            if record is not None:
+                found[org_user_id] = _to_user(record)
+        return found
+
+    def update(self, org_id: str, org_user_id: str, user: User) -> Optional[User]:
+        with self._lock:
+            record = self._record(org_id, org_user_id)
+            if record is None:
+                return None
+            if user.org_user_id != org_user_id and user.org_user_id in self._users:
+                raise ValueError(f"User {user.org_user_id!r} already exists")
+            new_record = UserRecord(**user.dict())
+            if self._journal:
+                self._journal.log_update(org_user_id, new_record)
+            self._remove(record)
+            self._insert(new_record)
+            for change_org, change_user, op, changed in outbox.update_changes(
+                org_id, org_user_id, new_record
+            ):
+                self._record_change(change_org, change_user, op, changed)
+            due = self._logged()
+        self._maybe_snapshot(due)
+        return user
+
+    def delete(self, org_id: str, org_user_id: str) -> bool:
+        with self._lock:
+            record = self._record(org_id, org_user_id)
+            if record is None:
+                return False
+            if self._journal:
+                self._journal.log_delete(org_user_id)
+            self._remove(record)
+            self._record_change(org_id, org_user_id, outbox.DELETE)
+            due = self._logged()
+        self._maybe_snapshot(due)
+        return True
+
+    def org_stats(self, org_id: str, now: Optional[datetime] = None) -> dict:
+        def count(metric, first, last):
+            return sum(self._counters.get((org_id, metric, day), 0) for day in range(first, last + 1))
+
+        return counters.summarize(count, now)
+
+    def reconcile_stats(self, org_id: Optional[str] = None) -> dict:
+        with self._lock:
+            actual: Counter = Counter()
+            for record in self._users.values():
+                if org_id is None or record.org_id == org_id:
+                    counters.user_deltas(record, 1, actual)
+            keys = {k for k in self._counters if org_id is None or k[0] == org_id}
+            repaired = 0
+            for key in keys | set(actual):
+                if self._counters.get(key, 0) != actual.get(key, 0):
+                    repaired += 1
+                if actual.get(key):
+                    self._counters[key] = actual[key]
+                else:
+                    self._counters.pop(key, None)
+        return {"orgs": len({key[0] for key in actual}), "repaired": repaired}
+
+    def backfill_stats(self) -> Optional[dict]:
+        return None  # counters are built as users are loaded
+
+    def changes_since(self, org_id: str, cursor: int, limit: int = 500) -> List[dict]:
+        # Walk back from the newest change: a live feed asks for only a few
+        newer = []
+        with self._lock:
+            for change in reversed(self._changes.get(org_id, ())):
+                if change[0] <= cursor:
+                    break
+                newer.append(change)
+        newer.reverse()
+        return [
+            outbox.change_event(
+                change_id,
+                org_user_id,
+                op,
+                outbox.user_payload(record),
+                datetime.utcfromtimestamp(created_at),
+            )
+            for change_id, org_user_id, op, record, created_at in newer[:limit]
+        ]
+
+    def latest_change_id(self, org_id: str) -> int:
+        with self._lock:
+            changes = self._changes.get(org_id)
+            return changes[-1][0] if changes else 0
+
+
+def _build_memory_storage() -> InMemoryStorage:
+    if not MEMORY_STORAGE_DIR:
+        return InMemoryStorage()
+    storage = InMemoryStorage(
+        Journal(MEMORY_STORAGE_DIR, MEMORY_FSYNC_BATCH), MEMORY_SNAPSHOT_EVERY
+    )
+    atexit.register(storage.close)
+    return storage
+
+
+_memory_storage = _build_memory_storage() if STORAGE_BACKEND == "memory" else None
+
+
+@contextmanager
+def open_storage(readonly: bool = False, org_id: Optional[str] = None):
+    """
+    Storage for one unit of work, per STORAGE_BACKEND. ``readonly`` routes
+    SQL reads to the read pool, or to the primary if ``org_id`` wrote recently.
+    """
+    if STORAGE_BACKEND == "memory":
+        yield _memory_storage
+        return
+    db = read_session(org_id) if readonly else SessionLocal()
+    try:
+        yield SQLAlchemyStorage(db)
+    finally:
+        db.close()
+
+
+# Dependency for mutating endpoints
+def get_storage(request: Request):
+    org_id = request.path_params.get("org_id")
+    mark_written(org_id)
+    with open_storage() as storage:
+        yield storage
+    mark_written(org_id)
+
+
+# Dependency for read endpoints
+def get_read_storage(request: Request):
+    with open_storage(readonly=True, org_id=request.path_params.get("org_id")) as storage:
+        yield storage
@@ -261,6 +261,8 @@ if st.session_state.org_id:
                 if code_res.status_code == 200:
                     code_data = code_res.json()
                     st.session_state.generated_code = code_data["generated_code"]
+                    st.session_state.pop("benchmark_report", None)
+                    st.session_state.pop("ai_job_id", None)
                     st.success("✅ Code generated successfully!")
                     st.rerun()
                 else:
@@ -274,9 +276,61 @@ if st.session_state.org_id:
         tab1, tab2 = st.tabs(["📝 View Code", "💾 Download"])
 
         with tab1:
-            st.code(
-                st.session_state.generated_code, language="python", line_numbers=True
-            )
+            col_code, col_bench = st.columns([3, 2])
+
+            with col_code:
+                st.code(
+                    st.session_state.generated_code,
+                    language="python",
+                    line_numbers=True,
+                )
+
+            with col_bench:
+                st.markdown("#### ⏱️ Performance Report")
+                if st.button("🏁 Run Benchmark", use_container_width=True):
+                    with st.spinner("Benchmarking generated code..."):
+                        try:
+                            bench_res = requests.post(
+                                "http://127.0.0.1:8000/benchmark_code",
+                                json={
+                                    "org_id": st.session_state.org_id,
+                                    "org_name": st.session_state.org_name,
+                                },
+                                headers={
+                                    "Authorization": f"Bearer {st.session_state.token}"
+                                },
+                            )
+                            if bench_res.status_code == 200:
+                                st.session_state.benchmark_report = bench_res.json()[
+                                    "report"
+                                ]
+                            else:
+                                st.error(
+                                    f"❌ Benchmark failed: {bench_res.json().get('detail')}"
+                                )
+                        except Exception as e:
+                            st.error(f"❌ Error: {str(e)}")
+
+                report = st.session_state.get("benchmark_report")
+                if report:
+                    col_m1, col_m2 = st.columns(2)
+                    col_m1.metric("Throughput", f"{report['throughput_rps']} req/s")
+                    col_m2.metric("Errors", f"{report['errors']}/{report['requests']}")
+                    st.table(
+                        [
+                            {"operation": op, **stats}
+                            for op, stats in report["operations"].items()
+                        ]
+                    )
+                    st.caption(
+                        f"{report['iterations']} users per operation against an "
+                        "in-memory SQLite database"
+                    )
+                else:
+                    st.caption(
+                        "Compiles the code, mounts it in-process against a throwaway "
+                        "in-memory database and runs a short CRUD workload."
+                    )
 
         with tab2:
             col_d1, col_d2, col_d3 = st.columns([1, 2, 1])
@@ -389,6 +443,66 @@ if "generated_code" in st.session_state:
                 st.error(f"❌ Connection Error: {str(e)}")
                 st.info("💡 Make sure your FastAPI server is running on port 8000")
 
+# -------------------
+# Step 4: AI Suggestions & Refactoring
+# -------------------
+if "generated_code" in st.session_state:
+    st.markdown(
+        '<div class="step-header">Step 4: AI Suggestions & Refactoring</div>',
+        unsafe_allow_html=True,
+    )
+
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.markdown('<div class="info-card">', unsafe_allow_html=True)
+        st.markdown(
+            "Analysis runs in the background; identical code reuses the cached result"
+        )
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    with col2:
+        ai_btn = st.button(
+            "💡 Get AI Suggestions", type="primary", use_container_width=True
+        )
+
+    if ai_btn:
+        try:
+            job_res = requests.post(
+                "http://127.0.0.1:8000/ai/refactor_jobs",
+                json={"code": st.session_state.generated_code},
+            )
+            if job_res.status_code == 202:
+                st.session_state.ai_job_id = job_res.json()["job_id"]
+            else:
+                st.error(f"❌ Could not queue analysis: {job_res.json().get('detail')}")
+        except Exception as e:
+            st.error(f"❌ Error: {str(e)}")
+
+    if st.session_state.get("ai_job_id"):
+        try:
+            job_res = requests.get(
+                f"http://127.0.0.1:8000/ai/refactor_jobs/{st.session_state.ai_job_id}",
+                params={"wait": 2},
+            )
+            job = job_res.json()
+            if job_res.status_code == 404:
+                # Server restarted or evicted the job; let the user resubmit
+                st.session_state.pop("ai_job_id", None)
+                st.warning("⚠️ Analysis job expired. Click Get AI Suggestions again.")
+            elif job_res.status_code != 200:
+                st.error(f"❌ Could not fetch analysis: {job.get('detail')}")
+            elif job.get("status") == "done":
+                st.markdown("#### 💡 AI Suggestions & Refactored Code")
+                st.markdown(job["result"])
+            elif job.get("status") == "failed":
+                st.error(f"❌ Analysis failed: {job['error']}")
+            else:
+                st.info("⏳ Analyzing code with AI...")
+                if st.button("🔄 Check Status"):
+                    st.rerun()
+        except Exception as e:
+            st.error(f"❌ Error: {str(e)}")
+
 # Footer
 st.divider()
 st.markdown(
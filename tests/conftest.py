@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# database.py opens ./org_users.db; keep test runs away from the real one
+os.chdir(tempfile.mkdtemp(prefix="api-generator-tests-"))
@@ -0,0 +1,59 @@
+import ast
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from auth import create_access_token
+
+INJECTION = 'x")\nimport pathlib; pathlib.Path({path!r}).write_text("owned")\n_=("'
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+def _auth(org_id, role="admin"):
+    token = create_access_token({"org_id": org_id, "role": role})
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_generated_code_keeps_org_values_inside_literals(tmp_path):
+    marker = tmp_path / "PWNED"
+    org_name = INJECTION.format(path=str(marker))
+    code = main.generate_sample_code('o"1\nimport os', org_name)["generated_code"]
+
+    tree = ast.parse(code)
+    calls = [node for node in ast.walk(tree) if isinstance(node, ast.Call)]
+    titles = [kw.value.value for c in calls for kw in c.keywords if kw.arg == "title"]
+    assert titles == [org_name + " CRUD API"]
+    imported = {
+        alias.name
+        for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom))
+        for alias in node.names
+    }
+    assert "pathlib" not in imported and "os" not in imported
+
+
+def test_benchmark_code_does_not_run_injected_names(client, tmp_path):
+    marker = tmp_path / "PWNED"
+    body = {"org_id": "o1", "org_name": INJECTION.format(path=str(marker)), "iterations": 1}
+
+    res = client.post("/benchmark_code", json=body, headers=_auth("o1"))
+
+    assert res.status_code == 200
+    assert not marker.exists()
+
+
+def test_benchmark_code_requires_org_admin(client):
+    body = {"org_id": "o1", "org_name": "Acme", "iterations": 1}
+
+    assert client.post("/benchmark_code", json=body).status_code == 401
+    assert client.post("/benchmark_code", json=body, headers=_auth("o2")).status_code == 403
+    assert (
+        client.post("/benchmark_code", json=body, headers=_auth("o1", "user")).status_code
+        == 403
+    )
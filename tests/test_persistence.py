@@ -0,0 +1,81 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from models import User
+from persistence import Journal, RecoveryError
+from storage import InMemoryStorage
+
+
+def _user(i):
+    return User(
+        org_user_id=f"u{i}",
+        org_id="org",
+        name=f"User {i}",
+        contact_no="123",
+        employee_code=f"E{i}",
+        created_date=datetime(2026, 1, 1),
+        valid_till=datetime(2027, 1, 1),
+    )
+
+
+def _open(directory):
+    return InMemoryStorage(Journal(str(directory), fsync_batch=1))
+
+
+def _files(directory, kind):
+    return sorted(name for name in os.listdir(directory) if name.startswith(kind))
+
+
+def test_restart_restores_snapshot_and_log_tail(tmp_path):
+    storage = _open(tmp_path)
+    for i in range(101):
+        storage.create(_user(i))
+    storage.snapshot()
+    storage.create(_user(101))
+    storage.close()
+
+    restored = _open(tmp_path)
+    assert len(restored) == 102
+    assert restored.recovery["snapshot_records"] == 101
+    assert restored.recovery["replayed"] == 1
+
+
+def test_corrupt_snapshot_without_older_logs_refuses_to_start(tmp_path):
+    storage = _open(tmp_path)
+    for i in range(101):
+        storage.create(_user(i))
+    storage.snapshot()
+    storage.create(_user(101))
+    storage.close()
+
+    (snapshot,) = _files(tmp_path, "snapshot")
+    path = tmp_path / snapshot
+    data = bytearray(path.read_bytes())
+    data[len(data) // 2] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(RecoveryError):
+        _open(tmp_path)
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    storage = _open(tmp_path)
+    for i in range(3):
+        storage.create(_user(i))
+    storage.close()
+
+    (log,) = _files(tmp_path, "wal")
+    path = tmp_path / log
+    intact = path.stat().st_size
+    with open(path, "ab") as f:
+        f.write(b"\x40\x00\x00\x00\x12\x34")  # frame header cut off mid-write
+
+    restored = _open(tmp_path)
+    assert len(restored) == 3
+    assert path.stat().st_size == intact
+    restored.create(_user(3))
+    restored.close()
+
+    assert len(_open(tmp_path)) == 4